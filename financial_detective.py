@@ -4,17 +4,249 @@ Extracts entities and relationships from Reliance Annual Report using LLM
 Outputs to JSON Knowledge Graph format
 """
 
+import asyncio
+import codecs
+import hashlib
 import json
+import mmap
 import os
+import re
 import sys
+import threading
+import unicodedata
 import requests
 import time
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import InvalidHeader
+from urllib3.util.retry import Retry
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from importlib.util import find_spec
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple, Union, BinaryIO, TextIO, Callable
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import FancyBboxPatch
 
+try:
+    import httpx
+except ImportError:  # Optional: concurrent calls fall back to a thread pool
+    httpx = None
+
+try:
+    import chardet
+except ImportError:  # Optional: non-UTF-8 input is decoded as cp1252 instead
+    chardet = None
+
+try:
+    import fastjsonschema
+except ImportError:  # Optional: falls back to the hand-written validator
+    fastjsonschema = None
+
+try:
+    import igraph as ig
+except ImportError:  # Optional: falls back to NetworkX spring_layout
+    ig = None
+
+try:
+    import faiss
+except ImportError:  # Optional: SemanticCache falls back to a numpy scan
+    faiss = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Optional: only needed for SemanticCache's default embedder
+    SentenceTransformer = None
+
+try:
+    import orjson
+except ImportError:  # Optional: stdlib json is used instead
+    orjson = None
+
+HTTP2_AVAILABLE = find_spec("h2") is not None
+
+
+def _json_loads(data):
+    """Parse JSON text or bytes, using orjson when available"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _json_dumps(data: Any, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes, using orjson when available"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False).encode("utf-8")
+
+# Bump whenever the extraction prompt changes so cached responses are not reused
+PROMPT_VERSION = "2"
+
+
+class LLMCache:
+    """Disk-backed cache of LLM responses, keyed by a SHA-256 of the request"""
+    
+    def __init__(self, cache_dir: str = ".llm_cache"):
+        self.cache_dir = Path(cache_dir)
+    
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Hash length-prefixed parts so field boundaries cannot collide"""
+        digest = hashlib.sha256()
+        for part in parts:
+            data = part.encode("utf-8")
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+        return digest.hexdigest()
+    
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None on a miss"""
+        try:
+            with open(self._path(key), 'rb') as f:
+                entry = _json_loads(f.read())
+            if entry.get("prompt_version") != PROMPT_VERSION:
+                return None
+            return entry["response"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            return None
+    
+    def set(self, key: str, response: str, model: str):
+        """Store a response atomically (write to temp file, then rename)"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "response": response,
+            "model": model,
+            "prompt_version": PROMPT_VERSION,
+            "created_at": time.time()
+        }
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(_json_dumps(entry))
+        os.replace(tmp_path, path)
+    
+    def delete(self, key: str):
+        """Drop a cached response"""
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SemanticCache:
+    """
+    In-memory cache that reuses extractions for near-duplicate chunks
+    
+    Chunks are embedded (MiniLM via sentence-transformers by default) and
+    L2-normalized, so inner product equals cosine similarity. A lookup hits
+    when the nearest stored chunk with the same context and the same figures
+    is at or above `threshold`.
+    
+    Templated paragraphs ("Revenue was ₹A crore in FY23" vs "... ₹B crore in
+    FY24") embed almost identically, so entries are partitioned by their
+    numeric and currency tokens: a chunk only ever reuses the response of a
+    chunk quoting exactly the same amounts.
+    """
+    
+    # Numbers (with separators) plus currency symbols, codes and magnitude words
+    FIGURES = re.compile(r"\d+(?:[.,]\d+)*|[₹$€£¥%]|\b(?:rs|inr|usd|cr|crores?|lakhs?|lacs?|mn|millions?|bn|billions?)\b",
+                         re.IGNORECASE)
+    
+    def __init__(self, threshold: float = 0.95, embed=None,
+                 model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+        """
+        Args:
+            threshold: Minimum cosine similarity for a hit
+            embed: Optional callable mapping a list of texts to a 2D array of embeddings
+            model_name: sentence-transformers model used when embed is not given
+        """
+        if embed is None:
+            if SentenceTransformer is None:
+                raise ImportError("SemanticCache requires sentence-transformers (pip install sentence-transformers)")
+            model = SentenceTransformer(model_name)
+            embed = lambda texts: model.encode(texts, convert_to_numpy=True)
+        
+        self.threshold = threshold
+        self._embed_fn = embed
+        self._indexes = {}  # (context, figures) -> (faiss index or list of vectors, responses)
+        self._lock = threading.Lock()
+    
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        """L2-normalized embeddings, reusable across lookup(), add() and near_duplicates()"""
+        vectors = np.asarray(self._embed_fn(texts), dtype="float32")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+    
+    @classmethod
+    def figures(cls, text: str) -> Tuple[str, ...]:
+        """The numeric and currency tokens a reused extraction must agree on exactly"""
+        return tuple(token.lower() for token in cls.FIGURES.findall(text))
+    
+    def near_duplicates(self, texts: List[str], vectors: Optional["np.ndarray"] = None) -> List[int]:
+        """
+        Map each text to the first earlier text it nearly duplicates
+        
+        Texts without an earlier match (or whose figures differ from every
+        close match) map to their own index, so texts that share a value can
+        share one extraction.
+        """
+        if vectors is None:
+            vectors = self.embed(texts)
+        similarities = vectors @ vectors.T
+        figures = [self.figures(text) for text in texts]
+        leaders: List[int] = []
+        for i in range(len(texts)):
+            matches = [j for j in set(leaders) if similarities[i, j] >= self.threshold and figures[i] == figures[j]]
+            leaders.append(min(matches) if matches else i)
+        return leaders
+    
+    def lookup(self, texts: List[str], context: str = "", vectors: Optional["np.ndarray"] = None) -> List[Optional[str]]:
+        """Return the cached response for each text, or None where there is no close match"""
+        with self._lock:
+            keys = [(context, self.figures(text)) for text in texts]
+            if not any(key in self._indexes for key in keys):
+                return [None] * len(texts)
+            
+            queries = self.embed(texts) if vectors is None else vectors
+            hits: List[Optional[str]] = [None] * len(texts)
+            for i, key in enumerate(keys):
+                if key not in self._indexes:
+                    continue
+                index, responses = self._indexes[key]
+                if faiss is not None:
+                    scores, ids = index.search(queries[i:i + 1], 1)
+                    best_score, best_id = scores[0, 0], ids[0, 0]
+                else:
+                    similarities = np.vstack(index) @ queries[i]
+                    best_id = int(similarities.argmax())
+                    best_score = similarities[best_id]
+                if best_score >= self.threshold:
+                    hits[i] = responses[best_id]
+            return hits
+    
+    def add(self, texts: List[str], responses: List[str], context: str = "",
+            vectors: Optional["np.ndarray"] = None):
+        """Store responses for the given texts"""
+        if not texts:
+            return
+        if vectors is None:
+            vectors = self.embed(texts)
+        with self._lock:
+            for text, response, vector in zip(texts, responses, vectors):
+                key = (context, self.figures(text))
+                if key not in self._indexes:
+                    index = faiss.IndexFlatIP(vectors.shape[1]) if faiss is not None else []
+                    self._indexes[key] = (index, [])
+                index, stored = self._indexes[key]
+                if faiss is not None:
+                    index.add(vector[None, :])
+                else:
+                    index.append(vector)
+                stored.append(response)
+
+
 class FinancialDetective:
     """Extract financial entities and relationships using LLM"""
     
@@ -53,14 +285,59 @@ class FinancialDetective:
         "required": ["entities", "relationships"]
     }
     
-    def __init__(self, api_provider: str = "groq", api_key: Optional[str] = None):
+    # Responses retried by both transports (urllib3 Retry for requests, hand-rolled for httpx)
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    # Cached under the fast model's key when its output was unusable, so re-runs go straight to the full model
+    ESCALATE_MARKER = "__escalate__"
+    
+    # Node colors by entity type (Blue=Company, Red=Risk, Green=Amount, Yellow=other)
+    COLOR_MAP = {"Company": "#4A90E2", "RiskFactor": "#E24A4A", "Amount": "#4AE24A"}
+    DEFAULT_COLOR = "#E2E24A"
+    
+    # Precomputed Mermaid node styles and id sanitizer
+    _MERMAID_STYLES = {t: f"fill:{color},stroke:#333,stroke-width:2px" for t, color in COLOR_MAP.items()}
+    _MERMAID_DEFAULT_STYLE = f"fill:{DEFAULT_COLOR},stroke:#333,stroke-width:2px"
+    _MERMAID_ID_TABLE = str.maketrans({" ": "_", "-": "_"})
+    
+    # Static extraction instructions, sent as an identical system prefix on every
+    # call so providers can reuse their prompt cache across chunks
+    SYSTEM_PROMPT = """You are a financial data extraction expert. Extract entities and relationships from text from a Reliance Annual Report.
+
+EXTRACTION REQUIREMENTS:
+1. ENTITIES: Company names (e.g. "Reliance Retail", "Jio"), Risk Factors (e.g. "Market volatility"), and financial Amounts in any currency (e.g. "$1.5 billion", "₹50,000 crores")
+2. RELATIONSHIPS: OWNS (Company -> Company), HAS (Company -> Amount), FACES (Company -> RiskFactor), PARTNERS_WITH (Company -> Company)
+
+OUTPUT FORMAT (strict JSON):
+{"entities": [{"id": "company_reliance_retail", "type": "Company", "name": "Reliance Retail", "value": null, "metadata": {}}, {"id": "amount_revenue_2023", "type": "Amount", "name": "Revenue 2023", "value": "$2.5 billion", "metadata": {"currency": "USD", "year": 2023}}], "relationships": [{"source": "company_reliance_retail", "target": "amount_revenue_2023", "type": "HAS", "metadata": {}}]}
+
+RULES:
+- Entity type is one of Company, RiskFactor, Amount; ids are unique descriptive slugs
+- Extract ALL companies, risk factors, amounts and the relationships between them
+- Return ONLY the JSON object, no additional text or explanation"""
+    
+    # Per-chunk user message
+    _PROMPT_TEMPLATE = "TEXT:\n{text}"
+    
+    # Compiled once at class load; None when fastjsonschema is not installed
+    _schema_validator = staticmethod(fastjsonschema.compile(KNOWLEDGE_GRAPH_SCHEMA)) if fastjsonschema else None
+    _loop_lock = threading.Lock()  # Guards lazy creation of the background event loop
+    
+    def __init__(self, api_provider: str = "groq", api_key: Optional[str] = None,
+                 cache_dir: Optional[str] = ".llm_cache", semantic_cache: bool = False,
+                 max_workers: int = 8):
         """
         Initialize Financial Detective
         
         Args:
             api_provider: "groq" or "openai"
             api_key: API key (if None, reads from environment)
+            cache_dir: Directory for cached LLM responses (None disables caching)
+            semantic_cache: Reuse extractions for near-duplicate chunks (needs sentence-transformers)
+            max_workers: Maximum number of LLM requests in flight at once (at least 1)
         """
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be at least 1, got {max_workers}")
+        
         self.api_provider = api_provider.lower()
         
         if api_key:
@@ -80,224 +357,948 @@ class FinancialDetective:
         if self.api_provider == "groq":
             self.api_url = "https://api.groq.com/openai/v1/chat/completions"
             self.model = "llama-3.3-70b-versatile"
+            self.fast_model = "llama-3.1-8b-instant"
         else:  # openai
             self.api_url = "https://api.openai.com/v1/chat/completions"
             self.model = "gpt-4o"
+            self.fast_model = "gpt-4o-mini"
         
         self.max_retries = 3
-    
-    def _build_extraction_prompt(self, text: str) -> str:
-        """Build prompt for LLM to extract entities and relationships"""
-        return f"""You are a financial data extraction expert. Extract entities and relationships from the following text from a Reliance Annual Report.
-
-EXTRACTION REQUIREMENTS:
-1. ENTITIES to extract:
-   - Company Names: All company names mentioned (e.g., "Reliance Retail", "Jio", "Hamleys")
-   - Risk Factors: Any risk factors mentioned (e.g., "Market volatility", "Regulatory changes")
-   - Dollar Amounts: Financial figures in USD, INR, or other currencies (e.g., "$1.5 billion", "₹50,000 crores")
-
-2. RELATIONSHIPS to extract:
-   - Ownership: "Company A OWNS Company B" (e.g., "Reliance Retail OWNS Hamleys")
-   - Financial: "Company HAS Amount" (e.g., "Reliance Retail HAS $2.5 billion revenue")
-   - Risk: "Company FACES RiskFactor" (e.g., "Reliance FACES Market volatility")
-   - Partnership: "Company PARTNERS_WITH Company" (e.g., "Jio PARTNERS_WITH Google")
-
-OUTPUT FORMAT (strict JSON):
-{{
-  "entities": [
-    {{
-      "id": "unique_id_1",
-      "type": "Company",
-      "name": "Reliance Retail",
-      "value": null,
-      "metadata": {{}}
-    }},
-    {{
-      "id": "unique_id_2",
-      "type": "Amount",
-      "name": "Revenue 2023",
-      "value": "$2.5 billion",
-      "metadata": {{"currency": "USD", "year": 2023}}
-    }},
-    {{
-      "id": "unique_id_3",
-      "type": "RiskFactor",
-      "name": "Market volatility",
-      "value": null,
-      "metadata": {{}}
-    }}
-  ],
-  "relationships": [
-    {{
-      "source": "unique_id_1",
-      "target": "unique_id_4",
-      "type": "OWNS",
-      "metadata": {{"year": 2023}}
-    }},
-    {{
-      "source": "unique_id_1",
-      "target": "unique_id_2",
-      "type": "HAS",
-      "metadata": {{}}
-    }}
-  ]
-}}
-
-RULES:
-- Use unique IDs for each entity (e.g., "company_reliance_retail", "amount_revenue_2023")
-- Extract ALL company names, risk factors, and dollar amounts mentioned
-- Extract ALL relationships between entities
-- Ensure JSON is valid and properly formatted
-- Do not use regex - use your understanding of the text
-
-TEXT TO ANALYZE:
-{text}
-
-Return ONLY the JSON object, no additional text or explanation."""
-
-    def _call_llm(self, prompt: str) -> str:
-        """Call LLM API with retry logic"""
-        headers = {
+        self.retry_backoff = 2.0  # urllib3-style backoff factor: no wait, then 4s, 8s, ... (capped at 120s)
+        self.max_continuations = 2
+        self.max_repairs = 2  # Feedback rounds for schema-invalid output (3 attempts in total)
+        self.repair_backoff = 1.0  # Seconds, grows linearly between repair rounds
+        self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
         
+        self._session = None  # Created on first use, see `session`
+        self._loop = None  # Background event loop for async calls, see `_run_async`
+        self._async_client = None  # Created on first use on that loop, see `_call_llm_many_async`
+        
+        self.cache = LLMCache(cache_dir) if cache_dir else None
+        self.semantic_cache = SemanticCache() if semantic_cache else None
+        
+        # Chunking / concurrency settings for long documents
+        self.chunk_size = 6000
+        self.chunk_overlap = 500
+        self.max_workers = max_workers
+    
+    @property
+    def session(self) -> requests.Session:
+        """Pooled keep-alive session; urllib3 retries 429/5xx and honors Retry-After"""
+        if self._session is None:
+            retry = Retry(
+                total=self.max_retries,
+                backoff_factor=self.retry_backoff,
+                status_forcelist=self.RETRY_STATUSES,
+                allowed_methods=None,  # POST is not retried by default
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            session = requests.Session()
+            session.headers.update(self.headers)
+            session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry))
+            self._session = session
+        return self._session
+    
+    @session.setter
+    def session(self, session: requests.Session):
+        self._session = session
+    
+    def _run_async(self, coro):
+        """
+        Run a coroutine on the detector's long-lived event loop and wait for the result
+        
+        The loop (and the httpx client bound to it) outlives each call, so the
+        cascade, escalation and repair passes, and later extractions, reuse the
+        same pooled connections instead of reconnecting under a new asyncio.run.
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="financial-detective-io", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
+    def close(self):
+        """Close pooled connections and stop the background event loop"""
+        if self._loop is not None:
+            if self._async_client is not None:
+                self._run_async(self._async_client.aclose())
+                self._async_client = None
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+    
+    def _retry_delay(self, retry_number: int, retry_after: Optional[str] = None) -> float:
+        """
+        Seconds to wait before the given retry (1-based), matching the session's urllib3 Retry
+        
+        A Retry-After header (seconds or HTTP date) wins over exponential backoff.
+        """
+        if retry_after:
+            try:
+                return Retry(respect_retry_after_header=True).parse_retry_after(retry_after)
+            except InvalidHeader:
+                pass
+        if retry_number <= 1:
+            return 0.0
+        return min(120.0, self.retry_backoff * 2 ** (retry_number - 1))
+    
+    def __getstate__(self) -> Dict:
+        """Pickle without live connections or the in-memory semantic index (e.g. for worker processes)"""
+        state = self.__dict__.copy()
+        state["_session"] = None
+        state["_loop"] = None
+        state["_async_client"] = None
+        state["semantic_cache"] = None
+        return state
+    
+    def _chunk_text(self, text: str, max_chars: Optional[int] = None, overlap: Optional[int] = None) -> List[str]:
+        """Split text into overlapping chunks on paragraph boundaries"""
+        max_chars = max_chars or self.chunk_size
+        overlap = self.chunk_overlap if overlap is None else overlap
+        
+        text = text.strip()
+        if len(text) <= max_chars:
+            return [text] if text else []
+        
+        # Break paragraphs into pieces that each fit in a single chunk
+        pieces = []
+        step = max(max_chars - overlap, 1)
+        for paragraph in text.split("\n\n"):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if len(paragraph) <= max_chars:
+                pieces.append(paragraph)
+            else:
+                pieces.extend(paragraph[i:i + max_chars] for i in range(0, max(len(paragraph) - overlap, 1), step))
+        
+        chunks = []
+        current = []
+        size = 0
+        for piece in pieces:
+            if current and size + len(piece) + 2 > max_chars:
+                chunks.append("\n\n".join(current))
+                
+                # Carry trailing paragraphs into the next chunk as overlap
+                carried = []
+                carried_size = 0
+                for prev in reversed(current):
+                    if carried_size + len(prev) + 2 > overlap:
+                        break
+                    carried.insert(0, prev)
+                    carried_size += len(prev) + 2
+                current, size = carried, carried_size
+                
+                while current and size + len(piece) + 2 > max_chars:
+                    size -= len(current.pop(0)) + 2
+            
+            current.append(piece)
+            size += len(piece) + 2
+        
+        if current:
+            chunks.append("\n\n".join(current))
+        
+        return chunks
+    
+    def _build_extraction_prompt(self, text: str) -> str:
+        """Build the per-chunk user message; static instructions live in SYSTEM_PROMPT"""
+        return self._PROMPT_TEMPLATE.format_map({"text": text})
+
+    def _build_payload(self, prompt: str, repair: Optional[Tuple[str, str]] = None,
+                       model: Optional[str] = None, partial: Optional[str] = None) -> Dict:
+        """
+        Build the JSON payload for a chat completion request
+        
+        Args:
+            prompt: Extraction prompt
+            repair: Optional (previous_output, error) to ask the model to fix its output
+            model: Model override (defaults to self.model)
+            partial: Output so far of a response cut off at max_tokens, to be continued
+        """
+        messages = [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        if repair:
+            previous_output, error = repair
+            messages.append({"role": "assistant", "content": previous_output})
+            messages.append({"role": "user", "content": f"Your output had error: {error}. Fix it and return ONLY the corrected JSON object."})
+        if partial:
+            messages.append({"role": "assistant", "content": partial})
+            messages.append({"role": "user", "content": "Your output was cut off. Continue the JSON exactly where it stopped, without repeating anything."})
+        
+        # JSON mode would force a fresh object, so it is off for continuations
         payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": "You are a financial data extraction expert. Always return valid JSON only."},
-                {"role": "user", "content": prompt}
-            ],
+            "model": model or self.model,
+            "messages": messages,
             "temperature": 0.1,  # Low temperature for consistent extraction
             "max_tokens": 4000,
-            "response_format": {"type": "json_object"} if self.api_provider == "openai" else None
+            "response_format": {"type": "json_object"} if self.api_provider == "openai" and not partial else None,
+            "stream": True  # Stream tokens so reads never wait on the full decode
         }
         
         # Remove None values
-        payload = {k: v for k, v in payload.items() if v is not None}
+        return {k: v for k, v in payload.items() if v is not None}
+    
+    def _cache_key(self, prompt: str, model: Optional[str] = None) -> str:
+        """LLM cache key for a prompt sent to the given model (the full model by default)"""
+        return LLMCache.make_key(self.api_provider, model or self.model, PROMPT_VERSION, prompt)
+    
+    def _lookup_cache(self, prompt: str, repair: Optional[Tuple[str, str]] = None,
+                      model: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+        """Return (cache_key, cached_response); cached_response is None on a miss"""
+        if not self.cache:
+            return None, None
         
-        for attempt in range(self.max_retries):
-            try:
-                response = requests.post(self.api_url, headers=headers, json=payload, timeout=120)
-                
-                if response.status_code == 429:
-                    wait_time = (2 ** attempt) * 2
-                    print(f"Rate limit hit. Waiting {wait_time} seconds...")
-                    time.sleep(wait_time)
-                    continue
-                
+        # Repaired responses are stored under the original prompt, but never served for a repair
+        cache_key = self._cache_key(prompt, model)
+        if repair:
+            return cache_key, None
+        
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            if cached == self.ESCALATE_MARKER or self._is_valid_response(cached):
+                return cache_key, cached
+            self.cache.delete(cache_key)
+        return cache_key, None
+    
+    @staticmethod
+    def _parse_sse_line(line) -> Tuple[str, Optional[str]]:
+        """Return (content delta, finish_reason) carried by one server-sent event line"""
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            return "", None
+        data = line[5:].strip()
+        if not data or data == "[DONE]":
+            return "", None
+        
+        choices = _json_loads(data).get("choices") or []
+        if not choices:
+            return "", None
+        return (choices[0].get("delta") or {}).get("content") or "", choices[0].get("finish_reason")
+    
+    def _finish_response(self, content: str, cache_key: Optional[str], model: Optional[str] = None) -> str:
+        """Clean the message content, storing it in the cache"""
+        # Clean up response (remove markdown code blocks if present)
+        content = content.strip()
+        if content.startswith("```json"):
+            content = content[7:]
+        if content.startswith("```"):
+            content = content[3:]
+        if content.endswith("```"):
+            content = content[:-3]
+        content = content.strip()
+        
+        if self.cache and self._is_valid_response(content):
+            self.cache.set(cache_key, content, model or self.model)
+        
+        return content
+    
+    def _call_llm(self, prompt: str, repair: Optional[Tuple[str, str]] = None,
+                  model: Optional[str] = None) -> str:
+        """Call LLM API (retries handled by the session), serving repeated prompts from the cache"""
+        cache_key, cached = self._lookup_cache(prompt, repair, model)
+        if cached is not None:
+            return cached
+        
+        # Ask the model to continue if the response is cut off at max_tokens
+        content = ""
+        for _ in range(self.max_continuations + 1):
+            piece, finish_reason = self._stream_completion(self._build_payload(prompt, repair, model, content or None))
+            content += piece
+            if finish_reason != "length":
+                break
+            print("✂️ Response hit max_tokens, requesting continuation...")
+        
+        return self._finish_response(content, cache_key, model)
+    
+    def _stream_completion(self, payload: Dict) -> Tuple[str, Optional[str]]:
+        """
+        POST one streaming request and return (content, finish_reason)
+        
+        urllib3 retries connection errors and 429/5xx before the body starts; a
+        stream that breaks mid-body is restarted here with the same backoff.
+        """
+        for retry_number in range(self.max_retries + 1):
+            with self.session.post(self.api_url, json=payload, timeout=120, stream=True) as response:
                 if response.status_code != 200:
-                    error_msg = f"API error {response.status_code}: {response.text}"
-                    if attempt < self.max_retries - 1:
-                        time.sleep(2 ** attempt)
-                        continue
-                    raise Exception(error_msg)
-                
-                response_data = response.json()
-                content = response_data["choices"][0]["message"]["content"]
-                
-                # Clean up response (remove markdown code blocks if present)
-                content = content.strip()
-                if content.startswith("```json"):
-                    content = content[7:]
-                if content.startswith("```"):
-                    content = content[3:]
-                if content.endswith("```"):
-                    content = content[:-3]
-                content = content.strip()
-                
-                return content
+                    raise Exception(f"API error {response.status_code}: {response.text}")
                 
-            except Exception as e:
-                if attempt < self.max_retries - 1:
-                    print(f"Attempt {attempt + 1} failed: {str(e)}. Retrying...")
-                    time.sleep(2 ** attempt)
+                parts = []
+                finish_reason = None
+                try:
+                    for line in response.iter_lines():
+                        delta, reason = self._parse_sse_line(line)
+                        parts.append(delta)
+                        finish_reason = reason or finish_reason
+                except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout) as e:
+                    if retry_number == self.max_retries:
+                        raise
+                    delay = self._retry_delay(retry_number + 1)
+                    print(f"Stream interrupted ({e}). Retrying in {delay:.0f} seconds...")
+                    time.sleep(delay)
                     continue
-                raise
+            
+            return "".join(parts), finish_reason
     
-    def _validate_json_schema(self, data: Dict) -> bool:
-        """Basic validation of JSON structure"""
-        if not isinstance(data, dict):
+    async def _call_llm_async(self, client: "httpx.AsyncClient", prompt: str,
+                              repair: Optional[Tuple[str, str]] = None, model: Optional[str] = None) -> str:
+        """Async variant of _call_llm using a shared httpx client"""
+        cache_key, cached = self._lookup_cache(prompt, repair, model)
+        if cached is not None:
+            return cached
+        
+        content = ""
+        for _ in range(self.max_continuations + 1):
+            payload = self._build_payload(prompt, repair, model, content or None)
+            piece, finish_reason = await self._stream_completion_async(client, payload)
+            content += piece
+            if finish_reason != "length":
+                break
+            print("✂️ Response hit max_tokens, requesting continuation...")
+        
+        return self._finish_response(content, cache_key, model)
+    
+    async def _stream_completion_async(self, client: "httpx.AsyncClient", payload: Dict) -> Tuple[str, Optional[str]]:
+        """
+        Async variant of _stream_completion with the same retry semantics as the session
+        
+        Retries RETRY_STATUSES (honoring Retry-After), connection errors and
+        streams that break mid-body, up to max_retries times.
+        """
+        for retry_number in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with client.stream("POST", self.api_url, json=payload) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        if response.status_code not in self.RETRY_STATUSES or retry_number == self.max_retries:
+                            raise Exception(f"API error {response.status_code}: {response.text}")
+                        retry_after = response.headers.get("Retry-After")
+                        failure = f"API error {response.status_code}"
+                    else:
+                        parts = []
+                        finish_reason = None
+                        async for line in response.aiter_lines():
+                            delta, reason = self._parse_sse_line(line)
+                            parts.append(delta)
+                            finish_reason = reason or finish_reason
+                        return "".join(parts), finish_reason
+            except httpx.TransportError as e:
+                if retry_number == self.max_retries:
+                    raise
+                failure = f"{type(e).__name__}: {e}"
+            
+            delay = self._retry_delay(retry_number + 1, retry_after)
+            print(f"{failure}. Retrying in {delay:.0f} seconds...")
+            await asyncio.sleep(delay)
+    
+    async def _call_llm_many_async(self, prompts: List[str], repairs: List[Optional[Tuple[str, str]]],
+                                   model: Optional[str] = None) -> List[str]:
+        """Run all prompts concurrently over the detector's pooled (HTTP/2 when available) client"""
+        # Bound requests in flight so long documents don't trip provider rate limits
+        semaphore = asyncio.Semaphore(self.max_workers)
+        
+        if self._async_client is None:
+            limits = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+            self._async_client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=limits, timeout=120, headers=self.headers)
+        client = self._async_client
+        
+        async def bounded(prompt: str, repair: Optional[Tuple[str, str]]) -> str:
+            async with semaphore:
+                return await self._call_llm_async(client, prompt, repair, model)
+        
+        return await asyncio.gather(*[bounded(p, r) for p, r in zip(prompts, repairs)])
+    
+    def _call_llm_many(self, prompts: List[str], repairs: Optional[List[Optional[Tuple[str, str]]]] = None,
+                       model: Optional[str] = None) -> List[str]:
+        """Call the LLM for every prompt concurrently, preserving order"""
+        repairs = repairs or [None] * len(prompts)
+        if httpx is not None and not self._in_event_loop():
+            return list(self._run_async(self._call_llm_many_async(prompts, repairs, model)))
+        
+        # Fall back to a thread pool when httpx is missing or a loop is already running
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(prompts))) as executor:
+            return list(executor.map(self._call_llm, prompts, repairs, [model] * len(prompts)))
+    
+    @staticmethod
+    def _in_event_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
             return False
+    
+    def _decode_graph(self, content: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """Parse and validate a raw response in one step, returning (data, error)"""
+        try:
+            data = _json_loads(content)
+        except ValueError as e:
+            return None, f"Invalid JSON ({e})"
+        error = self._schema_error(data)
+        return (None, error) if error else (data, None)
+    
+    def _response_error(self, content: str) -> Optional[str]:
+        """Return why a raw response is unusable, or None if it parses and matches the schema"""
+        return self._decode_graph(content)[1]
+    
+    def _is_valid_response(self, content: str) -> bool:
+        """Check that a raw response parses and matches the schema"""
+        return self._response_error(content) is None
+    
+    def _schema_error(self, data: Dict) -> Optional[str]:
+        """Return a description of the first schema violation, or None if data is valid"""
+        if self._schema_validator is not None:
+            try:
+                self._schema_validator(data)
+            except fastjsonschema.JsonSchemaException as e:
+                return str(e)
+            return None
+        
+        if not isinstance(data, dict):
+            return "data must be an object"
         
         if "entities" not in data or "relationships" not in data:
-            return False
+            return "data must contain ['entities', 'relationships'] properties"
         
         if not isinstance(data["entities"], list) or not isinstance(data["relationships"], list):
-            return False
+            return "data.entities and data.relationships must be arrays"
         
-        # Validate entities
-        for entity in data["entities"]:
+        # Validate entities (field types as well as presence, matching KNOWLEDGE_GRAPH_SCHEMA)
+        for i, entity in enumerate(data["entities"]):
             if not isinstance(entity, dict):
-                return False
+                return f"data.entities[{i}] must be an object"
             if "id" not in entity or "type" not in entity or "name" not in entity:
-                return False
+                return f"data.entities[{i}] must contain ['id', 'type', 'name'] properties"
+            for field in ("id", "type", "name"):
+                if not isinstance(entity[field], str):
+                    return f"data.entities[{i}].{field} must be string"
             if entity["type"] not in ["Company", "RiskFactor", "Amount"]:
-                return False
+                return f"data.entities[{i}].type must be one of ['Company', 'RiskFactor', 'Amount']"
+            value = entity.get("value")
+            if isinstance(value, bool) or not isinstance(value, (str, int, float, type(None))):
+                return f"data.entities[{i}].value must be string, number or null"
+            if not isinstance(entity.get("metadata", {}), dict):
+                return f"data.entities[{i}].metadata must be object"
         
         # Validate relationships
-        for rel in data["relationships"]:
+        for i, rel in enumerate(data["relationships"]):
             if not isinstance(rel, dict):
-                return False
+                return f"data.relationships[{i}] must be an object"
             if "source" not in rel or "target" not in rel or "type" not in rel:
-                return False
+                return f"data.relationships[{i}] must contain ['source', 'target', 'type'] properties"
+            for field in ("source", "target", "type"):
+                if not isinstance(rel[field], str):
+                    return f"data.relationships[{i}].{field} must be string"
+            if not isinstance(rel.get("metadata", {}), dict):
+                return f"data.relationships[{i}].metadata must be object"
         
-        return True
+        return None
+    
+    def _validate_json_schema(self, data: Dict) -> bool:
+        """Validate data against KNOWLEDGE_GRAPH_SCHEMA"""
+        return self._schema_error(data) is None
     
-    def extract_knowledge_graph(self, text_file_path: str) -> Dict:
+    def extract_knowledge_graph(self, text_file_path: str, on_attempt: Optional[Callable[[int], None]] = None,
+                                on_skip: Optional[Callable[[int], None]] = None) -> Dict:
         """
         Extract knowledge graph from text file
         
         Args:
             text_file_path: Path to input text file
+            on_attempt: Called with the attempt number when invalid output is sent back for repair
+            on_skip: Called with the 1-based chunk number when a chunk's response is unusable and skipped
             
         Returns:
             Dictionary with entities and relationships
         """
-        # Read input file
-        with open(text_file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+        # Chunk the input file without loading it into memory as one string
+        chunks = self._chunk_file(text_file_path)
+        
+        print(f"📄 Read {os.path.getsize(text_file_path)} bytes from {text_file_path}")
+        return self._extract_graph_from_chunks(chunks, on_attempt, on_skip)
+    
+    def extract_knowledge_graph_from_text(self, text: str, on_attempt: Optional[Callable[[int], None]] = None,
+                                          on_skip: Optional[Callable[[int], None]] = None) -> Dict:
+        """
+        Extract knowledge graph from text already in memory
+        
+        Args:
+            text: Input text
+            on_attempt: Called with the attempt number when invalid output is sent back for repair
+            on_skip: Called with the 1-based chunk number when a chunk's response is unusable and skipped
+            
+        Returns:
+            Dictionary with entities and relationships
+        """
+        chunks = self._chunk_text(unicodedata.normalize("NFKC", text))
+        
+        print(f"📄 Read {len(text)} characters")
+        return self._extract_graph_from_chunks(chunks, on_attempt, on_skip)
+    
+    def _extract_graph_from_chunks(self, chunks: List[str], on_attempt: Optional[Callable[[int], None]] = None,
+                                   on_skip: Optional[Callable[[int], None]] = None) -> Dict:
+        """Run extraction over prepared chunks and merge the results into one graph"""
+        if self.fast_model and self.fast_model != self.model:
+            print(f"🤖 Using {self.api_provider.upper()} API with model {self.fast_model}, falling back to {self.model}")
+        else:
+            print(f"🤖 Using {self.api_provider.upper()} API with model {self.model}")
+        
+        print(f"🔍 Extracting entities and relationships from {len(chunks)} chunk(s)...")
+        
+        if not chunks:
+            return {"entities": [], "relationships": []}
+        
+        responses = self._extract_chunks(chunks, on_attempt)
+        graph_data = self._merge_chunk_responses(responses, on_skip)
+        
+        print(f"✅ Extracted {len(graph_data['entities'])} entities and {len(graph_data['relationships'])} relationships")
+        
+        return graph_data
+    
+    def extract_knowledge_graph_batch(self, text_file_paths: List[str], poll_interval: float = 30,
+                                      on_attempt: Optional[Callable[[int], None]] = None) -> Dict[str, Dict]:
+        """
+        Extract knowledge graphs for several files through the provider's Batch API
+        
+        Cheaper than interactive calls but may take up to 24 hours; intended for
+        offline runs. Cached chunks are not resubmitted.
+        
+        Args:
+            text_file_paths: Paths to input text files
+            poll_interval: Seconds between batch status checks
+            on_attempt: Called with the attempt number when invalid output is sent back for repair
+            
+        Returns:
+            Dictionary mapping each input path to its knowledge graph
+        """
+        chunks_by_path = {path: self._chunk_file(path) for path in text_file_paths}
+        
+        # custom_id -> (prompt, cache_key); responses filled from cache or batch output
+        requests_by_id = {}
+        responses = {}
+        for file_index, path in enumerate(text_file_paths):
+            for chunk_index, chunk in enumerate(chunks_by_path[path]):
+                custom_id = f"{file_index}-{chunk_index}"
+                prompt = self._build_extraction_prompt(chunk)
+                cache_key, cached = self._lookup_cache(prompt)
+                if cached is not None:
+                    responses[custom_id] = cached
+                else:
+                    requests_by_id[custom_id] = (prompt, cache_key)
+        
+        print(f"📦 Submitting {len(requests_by_id)} chunk(s) from {len(text_file_paths)} file(s) as a batch "
+              f"({len(responses)} served from cache)")
+        
+        if requests_by_id:
+            results = self._run_batch({cid: prompt for cid, (prompt, _) in requests_by_id.items()}, poll_interval)
+            for custom_id, (prompt, cache_key) in requests_by_id.items():
+                if custom_id in results:
+                    responses[custom_id] = self._finish_response(results[custom_id], cache_key)
+                else:
+                    print(f"⚠️ Batch request {custom_id} failed, retrying interactively...")
+                    responses[custom_id] = self._call_llm(prompt)
+            
+            # Same bounded validation feedback as interactive extraction
+            self._repair_responses({cid: prompt for cid, (prompt, _) in requests_by_id.items()}, responses, on_attempt)
+        
+        graphs = {}
+        for file_index, path in enumerate(text_file_paths):
+            chunk_responses = [responses[f"{file_index}-{i}"] for i in range(len(chunks_by_path[path]))]
+            graphs[path] = self._merge_chunk_responses(chunk_responses)
+            print(f"✅ {path}: {len(graphs[path]['entities'])} entities and {len(graphs[path]['relationships'])} relationships")
+        
+        return graphs
+    
+    def _run_batch(self, prompts: Dict[str, str], poll_interval: float) -> Dict[str, str]:
+        """Submit prompts as one Batch API job and return raw message content by custom_id"""
+        base_url = self.api_url.rsplit("/chat/completions", 1)[0]
+        endpoint = "/v1/chat/completions"
+        
+        lines = []
+        for custom_id, prompt in prompts.items():
+            body = self._build_payload(prompt)
+            body.pop("stream", None)  # Batch jobs do not stream
+            lines.append(_json_dumps({"custom_id": custom_id, "method": "POST", "url": endpoint, "body": body}))
+        
+        # Upload without the session's JSON content type so requests builds multipart
+        upload = self.session.post(
+            f"{base_url}/files",
+            headers={"Content-Type": None},
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", b"\n".join(lines), "application/jsonl")},
+            timeout=120
+        )
+        upload.raise_for_status()
+        
+        created = self.session.post(
+            f"{base_url}/batches",
+            json={"input_file_id": upload.json()["id"], "endpoint": endpoint, "completion_window": "24h"},
+            timeout=120
+        )
+        created.raise_for_status()
+        batch = created.json()
+        
+        while batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+            print(f"⏳ Batch {batch['id']} is {batch['status']}...")
+            time.sleep(poll_interval)
+            status = self.session.get(f"{base_url}/batches/{batch['id']}", timeout=120)
+            status.raise_for_status()
+            batch = status.json()
+        
+        if batch["status"] != "completed" and not batch.get("output_file_id"):
+            raise Exception(f"Batch {batch['id']} ended with status {batch['status']}")
+        
+        results = {}
+        if batch.get("output_file_id"):
+            output = self.session.get(f"{base_url}/files/{batch['output_file_id']}/content", timeout=120)
+            output.raise_for_status()
+            for line in output.iter_lines():
+                if not line:
+                    continue
+                item = _json_loads(line)
+                response = item.get("response") or {}
+                if item.get("error") or response.get("status_code") != 200:
+                    continue
+                results[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        
+        return results
+    
+    def _extract_chunks(self, chunks: List[str], on_attempt: Optional[Callable[[int], None]] = None) -> List[str]:
+        """Get one raw LLM response per chunk, reusing semantic-cache hits and near-duplicate chunks"""
+        responses: List[Optional[str]] = [None] * len(chunks)
+        leaders = list(range(len(chunks)))
+        if self.semantic_cache:
+            vectors = self.semantic_cache.embed(chunks)
+            responses = self.semantic_cache.lookup(chunks, self._semantic_context(), vectors)
+            # Boilerplate repeated within this document is only sent once
+            leaders = self.semantic_cache.near_duplicates(chunks, vectors)
+            reused = sum(r is not None or leader != i for i, (r, leader) in enumerate(zip(responses, leaders)))
+            if reused:
+                print(f"♻️ Reusing {reused} extraction(s) for near-duplicate chunks")
+        
+        # Build prompts and call LLM concurrently for the remaining chunks
+        misses = [i for i, response in enumerate(responses) if response is None and leaders[i] == i]
+        prompts = {i: self._build_extraction_prompt(chunks[i]) for i in misses}
+        cascade = bool(self.fast_model) and self.fast_model != self.model
+        if misses:
+            first_model = self.fast_model if cascade else self.model
+            for i, response in zip(misses, self._call_llm_many([prompts[i] for i in misses], model=first_model)):
+                responses[i] = response
+        
+        # Cascade: re-run chunks the fast model got wrong (or found nothing in) on the full model
+        if cascade and misses:
+            escalate = [i for i in misses if self._needs_escalation(responses[i])]
+            print(f"🪜 Escalated {len(escalate)}/{len(misses)} chunk(s) from {self.fast_model} to {self.model}")
+            if self.cache:
+                # Valid-but-empty answers are already cached; remember that unusable ones need the full model
+                for i in escalate:
+                    if responses[i] != self.ESCALATE_MARKER and not self._is_valid_response(responses[i]):
+                        self.cache.set(self._cache_key(prompts[i], self.fast_model), self.ESCALATE_MARKER, self.fast_model)
+            if escalate:
+                for i, response in zip(escalate, self._call_llm_many([prompts[i] for i in escalate])):
+                    responses[i] = response
+        
+        self._repair_responses(prompts, responses, on_attempt)
+        
+        if self.semantic_cache:
+            valid = [i for i in misses if self._is_valid_response(responses[i])]
+            self.semantic_cache.add([chunks[i] for i in valid], [responses[i] for i in valid],
+                                    self._semantic_context(), vectors[valid])
+        
+        for i, leader in enumerate(leaders):
+            if responses[i] is None:
+                responses[i] = responses[leader]
+        
+        return responses
+    
+    def _repair_responses(self, prompts: Dict[Any, str], responses, on_attempt: Optional[Callable[[int], None]] = None):
+        """
+        Feed validation errors back to the model, a bounded number of times
         
-        print(f"📄 Read {len(text)} characters from {text_file_path}")
-        print(f"🤖 Using {self.api_provider.upper()} API with model {self.model}")
-        print("🔍 Extracting entities and relationships...")
+        Every key of `prompts` whose entry in `responses` (a list or dict) is
+        invalid is re-asked with its error, for up to max_repairs rounds with
+        linear backoff between rounds. Responses are replaced in place.
+        """
+        failed = list(prompts)
+        for repair_round in range(self.max_repairs):
+            errors = {key: self._response_error(responses[key]) for key in failed}
+            failed = [key for key in failed if errors[key]]
+            if not failed:
+                break
+            if repair_round:
+                time.sleep(self.repair_backoff * repair_round)
+            attempt = repair_round + 2
+            print(f"🔁 Attempt {attempt}: asking the model to fix {len(failed)} invalid response(s)...")
+            if on_attempt:
+                on_attempt(attempt)
+            fixed = self._call_llm_many([prompts[key] for key in failed], [(responses[key], errors[key]) for key in failed])
+            for key, response in zip(failed, fixed):
+                responses[key] = response
+    
+    def _needs_escalation(self, content: str) -> bool:
+        """A fast-model response is not trusted if it is invalid or extracted no entities"""
+        data, _ = self._decode_graph(content)
+        return data is None or not data["entities"]
+    
+    def _semantic_context(self) -> str:
+        """Near-duplicate hits are only shared between identical provider/model/prompt setups"""
+        return f"{self.api_provider}|{self.model}|{PROMPT_VERSION}"
+    
+    @staticmethod
+    def _detect_encoding(sample: bytes) -> str:
+        """Guess the encoding of a file from its first bytes"""
+        if sample.startswith(codecs.BOM_UTF8):
+            return "utf-8-sig"
+        if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return "utf-16"
+        try:
+            # Incremental decode so a character cut at the end of the sample is not an error
+            codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+            return "utf-8"
+        except UnicodeDecodeError:
+            pass
+        if chardet is not None:
+            detected = chardet.detect(sample)["encoding"]
+            if detected:
+                return detected
+        return "cp1252"
+    
+    def _chunk_file(self, path: str) -> List[str]:
+        """
+        Split a file into overlapping chunks via mmap, decoding one chunk at a time
         
-        # Build prompt
-        prompt = self._build_extraction_prompt(text)
+        Chunks are at most chunk_size bytes, cut at paragraph (or line) breaks,
+        and each chunk starts up to chunk_overlap bytes before the previous end.
+        The encoding is detected from the first 64KB and text is NFKC-normalized.
+        """
+        max_bytes, overlap = self.chunk_size, self.chunk_overlap
         
-        # Call LLM
-        response_text = self._call_llm(prompt)
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return []
+            
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                encoding = self._detect_encoding(mm[:65536])
+                if encoding == "utf-16":
+                    # Line breaks are two bytes wide; chunk the decoded text instead
+                    text = mm[:].decode(encoding, errors='replace')
+                    return self._chunk_text(unicodedata.normalize('NFKC', text))
+                
+                chunks = []
+                start = len(codecs.BOM_UTF8) if encoding == "utf-8-sig" else 0
+                encoding = "utf-8" if encoding == "utf-8-sig" else encoding
+                while start < size:
+                    end = min(start + max_bytes, size)
+                    if end < size:
+                        # Prefer to cut at a paragraph, then a line break
+                        cut = mm.rfind(b"\n\n", start, end)
+                        if cut <= start:
+                            cut = mm.rfind(b"\n", start, end)
+                        if cut > start:
+                            end = cut
+                        elif encoding == "utf-8":
+                            # No break at all: don't split a UTF-8 multi-byte character
+                            while end > start + 1 and mm[end] & 0xC0 == 0x80:
+                                end -= 1
+                    
+                    chunk = unicodedata.normalize('NFKC', mm[start:end].decode(encoding, errors='replace')).strip()
+                    if chunk:
+                        chunks.append(chunk)
+                    if end >= size:
+                        break
+                    
+                    # Overlap: restart at the first line break within the last `overlap` bytes,
+                    # or `overlap` bytes back when lines are longer than that
+                    overlap_start = max(end - overlap, start + 1)
+                    boundary = mm.find(b"\n", overlap_start, end)
+                    if boundary != -1:
+                        start = boundary + 1
+                    else:
+                        start = overlap_start
+                        if encoding == "utf-8":
+                            # Start on a character, not inside a multi-byte sequence
+                            while start < end and mm[start] & 0xC0 == 0x80:
+                                start += 1
+                
+                return chunks
+    
+    def _merge_chunk_responses(self, responses: List[str], on_skip: Optional[Callable[[int], None]] = None) -> Dict:
+        """
+        Parse every chunk's response and merge them, skipping chunks that are unusable
         
-        # Parse JSON
+        One bad chunk contributes an empty graph instead of failing the document;
+        the error is only raised when no chunk could be parsed at all. on_skip is
+        told about each skipped chunk so callers can avoid caching a partial graph.
+        """
+        graphs = []
+        error = None
+        for i, response in enumerate(responses, 1):
+            try:
+                graphs.append(self._parse_graph_response(response))
+            except ValueError as e:
+                print(f"⚠️ Skipping chunk {i}/{len(responses)}: unusable response ({e})")
+                if on_skip:
+                    on_skip(i)
+                error = e
+        if error is not None and not graphs:
+            raise error
+        return self._merge_graphs(graphs)
+    
+    def _parse_graph_response(self, response_text: str) -> Dict:
+        """Parse and validate a single LLM response"""
         try:
-            graph_data = json.loads(response_text)
+            graph_data = _json_loads(response_text)
         except json.JSONDecodeError as e:
-            print(f"❌ JSON parsing error: {e}")
-            print(f"Response text: {response_text[:500]}...")
-            raise
+            # A truncated response still holds usable complete items
+            graph_data = self._salvage_partial_graph(response_text)
+            if not graph_data["entities"]:
+                print(f"❌ JSON parsing error: {e}")
+                print(f"Response text: {response_text[:500]}...")
+                raise
+            print(f"⚠️ Salvaged {len(graph_data['entities'])} entities and "
+                  f"{len(graph_data['relationships'])} relationships from an incomplete response")
+        
+        if not isinstance(graph_data, dict):
+            raise ValueError(f"expected a JSON object, got {type(graph_data).__name__}")
         
         # Validate schema
         if not self._validate_json_schema(graph_data):
             print("⚠️ Warning: JSON structure doesn't match expected schema")
             print("Attempting to fix...")
-            # Try to fix common issues
-            if "entities" not in graph_data:
-                graph_data["entities"] = []
-            if "relationships" not in graph_data:
-                graph_data["relationships"] = []
-        
-        print(f"✅ Extracted {len(graph_data['entities'])} entities and {len(graph_data['relationships'])} relationships")
+            # Keep only well-formed items so one malformed entry can't break the merge
+            for key, fields in (("entities", ("id", "type", "name")), ("relationships", ("source", "target", "type"))):
+                items = graph_data.get(key)
+                graph_data[key] = [
+                    item for item in (items if isinstance(items, list) else [])
+                    if isinstance(item, dict) and all(isinstance(item.get(field), str) for field in fields)
+                ]
         
         return graph_data
     
+    @staticmethod
+    def _salvage_partial_graph(content: str) -> Dict:
+        """Recover every complete entity/relationship object from truncated JSON"""
+        decoder = json.JSONDecoder()
+        graph = {"entities": [], "relationships": []}
+        for key in graph:
+            start = content.find(f'"{key}"')
+            if start == -1:
+                continue
+            pos = content.find("[", start)
+            if pos == -1:
+                continue
+            pos += 1
+            while True:
+                while pos < len(content) and content[pos] in " \t\r\n,":
+                    pos += 1
+                if pos >= len(content) or content[pos] != "{":
+                    break
+                try:
+                    item, pos = decoder.raw_decode(content, pos)
+                except ValueError:
+                    break
+                graph[key].append(item)
+        return graph
+    
+    def _merge_graphs(self, graphs: List[Dict]) -> Dict:
+        """
+        Merge per-chunk graphs into one, de-duplicating entities and relationships
+        
+        Entities are canonicalized by (type, casefolded whitespace-normalized
+        name); relationship endpoints are rewritten to the canonical ids and
+        relationships pointing at unknown entities are dropped.
+        """
+        entities = []
+        relationships = []
+        canonical_ids = {}  # (type, name) -> canonical id
+        used_ids = set()
+        seen_edges = set()
+        
+        for graph in graphs:
+            # Entity ids are only unique within a single chunk's response
+            remap = {}
+            for entity in graph.get("entities", []):
+                if not all(key in entity for key in ("id", "type", "name")):
+                    continue
+                key = (entity["type"], " ".join(str(entity["name"]).split()).casefold())
+                if key not in canonical_ids:
+                    entity_id = entity["id"]
+                    suffix = 2
+                    while entity_id in used_ids:
+                        entity_id = f"{entity['id']}_{suffix}"
+                        suffix += 1
+                    used_ids.add(entity_id)
+                    canonical_ids[key] = entity_id
+                    entities.append({**entity, "id": entity_id})
+                remap[entity["id"]] = canonical_ids[key]
+            
+            for rel in graph.get("relationships", []):
+                if not all(key in rel for key in ("source", "target", "type")):
+                    continue
+                if rel["source"] not in remap or rel["target"] not in remap:
+                    continue
+                edge = (remap[rel["source"]], rel["type"], remap[rel["target"]])
+                if edge in seen_edges:
+                    continue
+                seen_edges.add(edge)
+                relationships.append({**rel, "source": edge[0], "target": edge[2]})
+        
+        return {"entities": entities, "relationships": relationships}
+    
     def save_graph_json(self, graph_data: Dict, output_path: str = "graph_output.json"):
         """Save knowledge graph to JSON file"""
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(graph_data, f, indent=2, ensure_ascii=False)
+        with open(output_path, 'wb') as f:
+            f.write(_json_dumps(graph_data, indent=True))
         print(f"💾 Saved knowledge graph to {output_path}")
     
-    def visualize_graph(self, graph_data: Dict, output_path: str = "graph_visualization.png"):
-        """Create NetworkX visualization of the knowledge graph"""
+    def _compute_layout(self, G: nx.DiGraph) -> Dict:
+        """Compute node positions, reusing a cached layout for an identical graph"""
+        if not self.cache or G.number_of_nodes() == 0:
+            return self._layout_graph(G)
+        
+        layout_dir = self.cache.cache_dir / "layouts"
+        algorithm = "igraph-fr-50" if ig is not None else "nx-spring-50"
+        key = LLMCache.make_key(algorithm, _json_dumps([sorted(G.nodes()), sorted(G.edges())]).decode("utf-8"))
+        path = layout_dir / f"{key}.npz"
+        
+        try:
+            with np.load(path) as cached:
+                return {node_id: tuple(xy) for node_id, xy in zip(cached["ids"].tolist(), cached["pos"])}
+        except (OSError, KeyError, ValueError):
+            pass
+        
+        pos = self._layout_graph(G)
+        nodes = list(pos)
+        layout_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, ids=np.array(nodes), pos=np.array([pos[n] for n in nodes], dtype=float))
+        os.replace(tmp_path, path)
+        return pos
+    
+    def _layout_graph(self, G: nx.DiGraph) -> Dict:
+        """Compute node positions, using igraph's C Fruchterman-Reingold when available"""
+        if ig is None or G.number_of_nodes() == 0:
+            return nx.spring_layout(G, k=2, iterations=50)
+        
+        nodes = list(G.nodes())
+        index = {node_id: i for i, node_id in enumerate(nodes)}
+        g = ig.Graph(n=len(nodes), edges=[(index[u], index[v]) for u, v in G.edges()], directed=True)
+        coords = g.layout_fruchterman_reingold(niter=50).coords
+        return {node_id: tuple(coords[i]) for i, node_id in enumerate(nodes)}
+    
+    def visualize_graph(self, graph_data: Dict, output_path: Union[str, BinaryIO] = "graph_visualization.png"):
+        """Create NetworkX visualization of the knowledge graph (output_path may be a binary file-like)"""
         # Create directed graph
         G = nx.DiGraph()
         
@@ -326,26 +1327,15 @@ Return ONLY the JSON object, no additional text or explanation."""
         
         # Create visualization
         plt.figure(figsize=(16, 12))
-        pos = nx.spring_layout(G, k=2, iterations=50)
+        pos = self._compute_layout(G)
         
         # Color nodes by type
-        node_colors = []
-        for node_id in G.nodes():
-            entity_type = G.nodes[node_id]["type"]
-            if entity_type == "Company":
-                node_colors.append("#4A90E2")  # Blue
-            elif entity_type == "RiskFactor":
-                node_colors.append("#E24A4A")  # Red
-            elif entity_type == "Amount":
-                node_colors.append("#4AE24A")  # Green
-            else:
-                node_colors.append("#E2E24A")  # Yellow
+        node_colors = [self.COLOR_MAP.get(entity_map[n]["type"], self.DEFAULT_COLOR) for n in G.nodes()]
         
-        # Draw nodes
-        nx.draw_networkx_nodes(G, pos, 
-                              node_color=node_colors,
-                              node_size=2000,
-                              alpha=0.8)
+        # Draw all nodes in a single scatter call
+        nodes = list(G.nodes())
+        plt.scatter([pos[n][0] for n in nodes], [pos[n][1] for n in nodes],
+                    c=node_colors, s=2000, alpha=0.8, zorder=2)
         
         # Draw edges
         nx.draw_networkx_edges(G, pos,
@@ -367,60 +1357,52 @@ Return ONLY the JSON object, no additional text or explanation."""
                  fontsize=16, fontweight='bold', pad=20)
         plt.axis('off')
         plt.tight_layout()
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        print(f"📊 Saved visualization to {output_path}")
+        plt.savefig(output_path, format='png', dpi=300, bbox_inches='tight')
+        if isinstance(output_path, (str, os.PathLike)):
+            print(f"📊 Saved visualization to {output_path}")
         plt.close()
     
-    def generate_mermaid_chart(self, graph_data: Dict, output_path: str = "graph_mermaid.md"):
-        """Generate Mermaid chart representation"""
-        mermaid_lines = ["graph TD"]
+    def generate_mermaid_chart(self, graph_data: Dict, output_path: Union[str, TextIO] = "graph_mermaid.md"):
+        """Generate Mermaid chart representation (output_path may be a text file-like)"""
+        if not isinstance(output_path, (str, os.PathLike)):
+            self._write_mermaid(graph_data, output_path)
+            return
+        
+        with open(output_path, 'w', encoding='utf-8') as f:
+            self._write_mermaid(graph_data, f)
+        
+        print(f"📈 Saved Mermaid chart to {output_path}")
+    
+    def _write_mermaid(self, graph_data: Dict, out):
+        """Stream the Mermaid markdown document to a text file-like object"""
+        out.write("# Financial Knowledge Graph (Mermaid)\n\n```mermaid\ngraph TD\n")
         
         # Add nodes
         for entity in graph_data["entities"]:
-            entity_id = entity["id"].replace(" ", "_").replace("-", "_")
-            name = entity["name"]
-            entity_type = entity["type"]
-            
-            # Style based on type
-            if entity_type == "Company":
-                style = "fill:#4A90E2,stroke:#333,stroke-width:2px"
-            elif entity_type == "RiskFactor":
-                style = "fill:#E24A4A,stroke:#333,stroke-width:2px"
-            elif entity_type == "Amount":
-                style = "fill:#4AE24A,stroke:#333,stroke-width:2px"
-            else:
-                style = "fill:#E2E24A,stroke:#333,stroke-width:2px"
-            
-            mermaid_lines.append(f'    {entity_id}["{name}"]')
-            mermaid_lines.append(f'    style {entity_id} {style}')
+            entity_id = entity["id"].translate(self._MERMAID_ID_TABLE)
+            style = self._MERMAID_STYLES.get(entity["type"], self._MERMAID_DEFAULT_STYLE)
+            out.write(f'    {entity_id}["{entity["name"]}"]\n    style {entity_id} {style}\n')
         
         # Add edges
         for rel in graph_data["relationships"]:
-            source = rel["source"].replace(" ", "_").replace("-", "_")
-            target = rel["target"].replace(" ", "_").replace("-", "_")
-            rel_type = rel["type"]
-            mermaid_lines.append(f'    {source} -->|{rel_type}| {target}')
-        
-        mermaid_content = "\n".join(mermaid_lines)
+            source = rel["source"].translate(self._MERMAID_ID_TABLE)
+            target = rel["target"].translate(self._MERMAID_ID_TABLE)
+            out.write(f'    {source} -->|{rel["type"]}| {target}\n')
         
-        # Wrap in markdown code block
-        full_content = f"""# Financial Knowledge Graph (Mermaid)
-
-```mermaid
-{mermaid_content}
-```
-
-## Entities
-{len(graph_data['entities'])} entities extracted
+        out.write(
+            "```\n\n"
+            f"## Entities\n{len(graph_data['entities'])} entities extracted\n\n"
+            f"## Relationships\n{len(graph_data['relationships'])} relationships extracted\n"
+        )
 
-## Relationships
-{len(graph_data['relationships'])} relationships extracted
-"""
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(full_content)
-        
-        print(f"📈 Saved Mermaid chart to {output_path}")
+def _positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1"""
+    import argparse
+    
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
 
 def main():
@@ -435,6 +1417,16 @@ def main():
     parser.add_argument("--api-key", "-k", help="API key (or set GROQ_API_KEY/OPENAI_API_KEY env var)")
     parser.add_argument("--visualize", "-v", action="store_true", help="Generate NetworkX visualization")
     parser.add_argument("--mermaid", "-m", action="store_true", help="Generate Mermaid chart")
+    parser.add_argument("--cache-dir", default=".llm_cache", help="Directory for cached LLM responses")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the LLM API, ignoring cached responses")
+    parser.add_argument("--no-cascade", action="store_true",
+                       help="Send every chunk to the full model instead of trying the fast model first")
+    parser.add_argument("--batch", action="store_true",
+                       help="Submit chunks through the provider Batch API (cheaper, may take up to 24h)")
+    parser.add_argument("--concurrency", type=_positive_int, default=8,
+                        help="Maximum number of concurrent LLM requests (default: 8)")
+    parser.add_argument("--semantic-cache", action="store_true",
+                       help="Reuse extractions for near-duplicate chunks (requires sentence-transformers)")
     
     args = parser.parse_args()
     
@@ -445,24 +1437,37 @@ def main():
     
     # Initialize detector
     try:
-        detector = FinancialDetective(api_provider=args.provider, api_key=args.api_key)
-    except ValueError as e:
+        detector = FinancialDetective(api_provider=args.provider, api_key=args.api_key,
+                                      cache_dir=None if args.no_cache else args.cache_dir,
+                                      semantic_cache=args.semantic_cache, max_workers=args.concurrency)
+    except (ValueError, ImportError) as e:
         print(f"❌ Error: {e}")
         sys.exit(1)
     
+    if args.no_cascade:
+        detector.fast_model = None
+    
     # Extract knowledge graph
     try:
-        graph_data = detector.extract_knowledge_graph(args.input)
-        
-        # Save JSON
-        detector.save_graph_json(graph_data, args.output)
-        
-        # Generate visualizations if requested
-        if args.visualize:
-            detector.visualize_graph(graph_data, "graph_visualization.png")
+        if args.batch:
+            graph_data = detector.extract_knowledge_graph_batch([args.input])[args.input]
+        else:
+            graph_data = detector.extract_knowledge_graph(args.input)
         
-        if args.mermaid:
-            detector.generate_mermaid_chart(graph_data, "graph_mermaid.md")
+        # Render the PNG in a worker process (matplotlib is CPU-bound and not thread-safe) while the
+        # JSON and Mermaid files are written here; no pool is started when there is no PNG to render
+        executor = ProcessPoolExecutor(max_workers=1) if args.visualize else None
+        try:
+            png = executor.submit(detector.visualize_graph, graph_data, "graph_visualization.png") if executor else None
+            detector.save_graph_json(graph_data, args.output)
+            if args.mermaid:
+                detector.generate_mermaid_chart(graph_data, "graph_mermaid.md")
+            if png:
+                png.result()
+        finally:
+            if executor:
+                executor.shutdown()
+        detector.close()
         
         print("\n✅ Extraction complete!")
         print(f"   Entities: {len(graph_data['entities'])}")
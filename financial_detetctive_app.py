@@ -4,12 +4,18 @@ Web UI for extracting knowledge graphs from financial documents
 """
 
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import os
+import io
+import re
 import json
-import tempfile
+import hashlib
+from collections import Counter
 from pathlib import Path
-from financial_detective import FinancialDetective
-import base64
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    from financial_detective import FinancialDetective
 
 st.set_page_config(
     page_title="Financial Detective",
@@ -18,11 +24,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
-    
+# Custom CSS; the font is linked (not @import-ed) so it doesn't block the stylesheet
+_CSS_SOURCE = """
     :root {
         --primary: #1f77b4;
         --secondary: #ff7f0e;
@@ -87,34 +90,311 @@ st.markdown("""
         margin-bottom: 0.5rem;
         border-left: 4px solid var(--secondary);
     }
-</style>
-""", unsafe_allow_html=True)
+"""
+
+@st.cache_resource
+def _minified_css() -> str:
+    """Whitespace-stripped stylesheet, computed once per server process rather than per rerun"""
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", " ".join(_CSS_SOURCE.split()))
+
+_FONTS = (
+    "<link rel='preconnect' href='https://fonts.gstatic.com' crossorigin>"
+    "<link rel='stylesheet' href='https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap'>"
+)
+st.markdown(f"{_FONTS}<style>{_minified_css()}</style>", unsafe_allow_html=True)
 
 # Initialize session state
 if 'graph_data' not in st.session_state:
     st.session_state.graph_data = None
 if 'extraction_complete' not in st.session_state:
     st.session_state.extraction_complete = False
+# Rendered artifacts for the current graph, computed once and reused across reruns
+if 'viz_png' not in st.session_state:
+    st.session_state.viz_png = None
+if 'mermaid_md' not in st.session_state:
+    st.session_state.mermaid_md = None
+if 'type_counts' not in st.session_state:
+    st.session_state.type_counts = None
+if 'graph_json' not in st.session_state:
+    st.session_state.graph_json = None
+# (provider, concurrency, use_cache) of the detector that produced graph_data
+if 'graph_detector' not in st.session_state:
+    st.session_state.graph_detector = None
+
+API_KEY_NAMES = {"groq": "GROQ_API_KEY", "openai": "OPENAI_API_KEY"}
+
+def _read_secret(name: str) -> Optional[str]:
+    """Look up a secret, treating a missing secrets.toml as no secret"""
+    try:
+        return st.secrets.get(name)
+    except (FileNotFoundError, StreamlitAPIException):
+        return None
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_api_key(provider: str) -> str:
+    """Get API key from secrets or environment (memoized so reruns don't re-probe secrets)"""
+    name = API_KEY_NAMES.get(provider, "OPENAI_API_KEY")
+    return _read_secret(name) or os.getenv(name, "")
 
+@st.cache_data(ttl=300, show_spinner=False)
 def check_api_key(provider: str) -> bool:
     """Check if API key is available"""
-    if provider == "groq":
-        return bool(os.getenv("GROQ_API_KEY") or st.secrets.get("GROQ_API_KEY", None))
-    else:
-        return bool(os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY", None))
+    return bool(get_api_key(provider))
 
-def get_api_key(provider: str) -> str:
-    """Get API key from secrets or environment"""
+def api_key_fingerprint(api_key: str) -> str:
+    """Short hash of an API key, so the secret itself is never a cache key"""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+@st.cache_resource
+def _load_detective_cls() -> "type[FinancialDetective]":
+    """Import the extraction backend (networkx, matplotlib) on first use rather than on page load"""
+    from financial_detective import FinancialDetective
+    return FinancialDetective
+
+@st.cache_resource
+def _cached_detector(provider: str, key_fingerprint: str, max_workers: int, use_cache: bool,
+                     _api_key: str) -> "FinancialDetective":
+    # Streamlit does not hash underscore-prefixed arguments
+    return _load_detective_cls()(api_provider=provider, api_key=_api_key, max_workers=max_workers,
+                                 cache_dir=".llm_cache" if use_cache else None)
+
+def get_detector(provider: str, api_key: str, max_workers: int = 8, use_cache: bool = True) -> "FinancialDetective":
+    """Shared detector (and HTTP connection pool) per provider, API key, concurrency and cache setting"""
+    return _cached_detector(provider, api_key_fingerprint(api_key), max_workers, use_cache, api_key)
+
+# Extracted graphs cached by content, next to this file
+GRAPH_CACHE_DIR = Path(__file__).parent / "cache"
+
+def graph_cache_path(detector: "FinancialDetective", text_content: str) -> Path:
+    """Content-addressable cache path for a document's knowledge graph under this provider and models"""
+    from financial_detective import LLMCache, PROMPT_VERSION
+    key = LLMCache.make_key("v2", detector.api_provider, detector.model, detector.fast_model or "",
+                            PROMPT_VERSION, text_content)
+    return GRAPH_CACHE_DIR / f"{key}.json"
+
+def load_cached_graph(path: Path) -> Optional[Dict]:
+    """Return the cached graph at path, or None on a miss"""
     try:
-        if provider == "groq":
-            return st.secrets.get("GROQ_API_KEY") or os.getenv("GROQ_API_KEY", "")
-        else:
-            return st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY", "")
-    except:
-        if provider == "groq":
-            return os.getenv("GROQ_API_KEY", "")
-        else:
-            return os.getenv("OPENAI_API_KEY", "")
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def store_cached_graph(path: Path, graph_data: Dict):
+    """Write the graph atomically (temp file + rename)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(graph_data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def extract_graph(provider: str, text_content: str, concurrency: int = 8,
+                  on_attempt: Optional[Callable[[int], None]] = None, use_cache: bool = True) -> Dict:
+    """
+    Run LLM extraction on the text, with at most `concurrency` chunk requests in flight
+    
+    use_cache=False also bypasses the detector's per-chunk LLM response cache.
+    """
+    detector = get_detector(provider, get_api_key(provider), concurrency, use_cache)
+    return detector.extract_knowledge_graph_from_text(text_content, on_attempt=on_attempt)
+
+def extract_graph_cached(provider: str, text_content: str, concurrency: int = 8,
+                         on_attempt: Optional[Callable[[int], None]] = None) -> Dict:
+    """
+    Extraction cached on disk, keyed by provider, models and content
+    
+    Partial graphs (some chunk's response was unusable and skipped) are not stored,
+    so the next run retries the missing chunks; valid chunks come from the LLM cache.
+    """
+    # Not st.cache_data: extraction reports progress to placeholders created by the caller,
+    # which st.cache_data cannot replay
+    detector = get_detector(provider, get_api_key(provider), concurrency)
+    path = graph_cache_path(detector, text_content)
+    graph_data = load_cached_graph(path)
+    if graph_data is None:
+        skipped = []
+        graph_data = detector.extract_knowledge_graph_from_text(text_content, on_attempt=on_attempt,
+                                                                on_skip=skipped.append)
+        if not skipped:
+            store_cached_graph(path, graph_data)
+    return graph_data
+
+def get_type_counts(graph_data: Dict) -> Counter:
+    """Entity counts per type for the current graph, computed once in a single pass"""
+    if st.session_state.type_counts is None:
+        st.session_state.type_counts = Counter(e['type'] for e in graph_data['entities'])
+    return st.session_state.type_counts
+
+def serialize_graph(graph_data: Dict) -> bytes:
+    """Pretty-printed JSON for the current graph (orjson when available), serialized once"""
+    if st.session_state.graph_json is None:
+        from financial_detective import _json_dumps
+        st.session_state.graph_json = _json_dumps(graph_data, indent=True)
+    return st.session_state.graph_json
+
+def graph_detector() -> "FinancialDetective":
+    """The detector that extracted the current graph, so rendering reuses it and its caches"""
+    provider, concurrency, use_cache = st.session_state.graph_detector
+    return get_detector(provider, get_api_key(provider), concurrency, use_cache)
+
+def get_viz_png(graph_data: Dict) -> bytes:
+    """NetworkX visualization PNG for the current graph, rendered once"""
+    if st.session_state.viz_png is None:
+        buf = io.BytesIO()
+        graph_detector().visualize_graph(graph_data, buf)
+        st.session_state.viz_png = buf.getvalue()
+    return st.session_state.viz_png
+
+def get_mermaid_md(graph_data: Dict) -> str:
+    """Mermaid markdown for the current graph, rendered once"""
+    if st.session_state.mermaid_md is None:
+        buf = io.StringIO()
+        graph_detector().generate_mermaid_chart(graph_data, buf)
+        st.session_state.mermaid_md = buf.getvalue()
+    return st.session_state.mermaid_md
+
+@st.fragment
+def _results_fragment(graph_data: Dict, generate_viz: bool, generate_mermaid: bool):
+    """Results tab; widget interactions here rerun only this fragment"""
+    import pandas as pd  # Only needed once there are results to show
+    
+    # Summary metrics
+    type_counts = get_type_counts(graph_data)
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Total Entities", len(graph_data['entities']))
+    
+    with col2:
+        st.metric("Companies", type_counts.get('Company', 0))
+    
+    with col3:
+        st.metric("Amounts", type_counts.get('Amount', 0))
+    
+    with col4:
+        st.metric("Relationships", len(graph_data['relationships']))
+    
+    st.divider()
+    
+    # Entities section
+    st.subheader("🏢 Entities")
+    
+    # Filter by type
+    entity_types = st.multiselect(
+        "Filter by type:",
+        ["Company", "RiskFactor", "Amount"],
+        default=["Company", "RiskFactor", "Amount"]
+    )
+    
+    filtered_entities = [e for e in graph_data['entities'] if e['type'] in entity_types]
+    
+    type_emoji = {
+        "Company": "🏢",
+        "RiskFactor": "⚠️",
+        "Amount": "💰"
+    }
+    
+    # One table instead of a widget per entity
+    entities_df = pd.DataFrame(
+        [{
+            "type": f"{type_emoji.get(e['type'], '📌')} {e['type']}",
+            "name": e['name'],
+            "value": None if e.get('value') is None else str(e['value']),
+            "id": e['id'],
+        } for e in filtered_entities],
+        columns=["type", "name", "value", "id"]
+    )
+    st.dataframe(entities_df, use_container_width=True, hide_index=True)
+    
+    if filtered_entities:
+        inspected = st.selectbox(
+            "Inspect entity",
+            range(len(filtered_entities)),
+            format_func=lambda i: f"{type_emoji.get(filtered_entities[i]['type'], '📌')} {filtered_entities[i]['name']} ({filtered_entities[i]['type']})"
+        )
+        st.json(filtered_entities[inspected])
+    
+    st.divider()
+    
+    # Relationships section
+    st.subheader("🔗 Relationships")
+    
+    id_to_name = {e['id']: e['name'] for e in graph_data['entities']}
+    relationships_df = pd.DataFrame(
+        [{
+            "source_name": id_to_name.get(rel['source'], rel['source']),
+            "type": rel['type'],
+            "target_name": id_to_name.get(rel['target'], rel['target']),
+        } for rel in graph_data['relationships']],
+        columns=["source_name", "type", "target_name"]
+    )
+    st.dataframe(relationships_df, use_container_width=True, hide_index=True)
+    
+    st.divider()
+    
+    # Visualizations
+    if generate_viz or generate_mermaid:
+        st.subheader("📈 Visualizations")
+        
+        if generate_viz:
+            try:
+                st.image(get_viz_png(graph_data), caption="Knowledge Graph Visualization (NetworkX)")
+            except Exception as e:
+                st.error(f"Error generating visualization: {e}")
+        
+        if generate_mermaid:
+            try:
+                st.markdown("### Mermaid Chart")
+                st.code(get_mermaid_md(graph_data), language='markdown')
+                st.info("💡 Copy the Mermaid code above and paste it into https://mermaid.live to view the interactive chart")
+            except Exception as e:
+                st.error(f"Error generating Mermaid chart: {e}")
+    
+    # Full JSON view
+    st.divider()
+    st.subheader("📋 Full JSON Output")
+    with st.expander("View complete JSON"):
+        st.json(graph_data)
+
+@st.fragment
+def _downloads_fragment(graph_data: Dict, generate_viz: bool, generate_mermaid: bool):
+    """Downloads tab, rerun independently of the rest of the page"""
+    # JSON download
+    st.download_button(
+        label="⬇️ Download JSON (graph_output.json)",
+        data=serialize_graph(graph_data),
+        file_name="graph_output.json",
+        mime="application/json",
+        use_container_width=True
+    )
+    
+    # Generate and download visualization if requested
+    if generate_viz:
+        try:
+            st.download_button(
+                label="⬇️ Download Visualization (graph_visualization.png)",
+                data=get_viz_png(graph_data),
+                file_name="graph_visualization.png",
+                mime="image/png",
+                use_container_width=True
+            )
+        except Exception as e:
+            st.error(f"Error generating visualization: {e}")
+    
+    # Generate and download Mermaid if requested
+    if generate_mermaid:
+        try:
+            st.download_button(
+                label="⬇️ Download Mermaid Chart (graph_mermaid.md)",
+                data=get_mermaid_md(graph_data),
+                file_name="graph_mermaid.md",
+                mime="text/markdown",
+                use_container_width=True
+            )
+        except Exception as e:
+            st.error(f"Error generating Mermaid chart: {e}")
+    
+    st.success("✅ All outputs ready for download!")
 
 # Header
 st.title("🕵️ Financial Detective")
@@ -145,6 +425,10 @@ with st.sidebar:
     st.header("📊 Visualization Options")
     generate_viz = st.checkbox("Generate NetworkX Visualization", value=True)
     generate_mermaid = st.checkbox("Generate Mermaid Chart", value=True)
+    use_cache = st.checkbox("Use cache", value=True,
+                            help="Reuse the graph from a previous extraction of the same document")
+    concurrency = st.slider("LLM concurrency", 1, 16, 8,
+                            help="Maximum number of document chunks sent to the LLM at once")
     
     st.divider()
     
@@ -180,18 +464,32 @@ with tab1:
         )
         
         if uploaded_file is not None:
-            text_content = uploaded_file.read().decode('utf-8')
+            # Decode incrementally instead of materializing the bytes and the str side by side
+            uploaded_file.seek(0)
+            reader = io.TextIOWrapper(uploaded_file, encoding='utf-8')
+            text_content = reader.read()
+            reader.detach()
             st.success(f"✅ File uploaded: {uploaded_file.name} ({len(text_content)} characters)")
             
+            preview = text_content[:1000]
+            if len(text_content) > 1000:
+                preview += "..."
             with st.expander("📄 Preview uploaded content"):
-                st.text_area("Content preview", text_content[:1000] + "..." if len(text_content) > 1000 else text_content, height=200)
+                st.text_area("Content preview", preview, height=200)
     
     else:  # Paste Text
-        text_content = st.text_area(
-            "Paste your financial document text here:",
-            height=400,
-            placeholder="Paste the text from your annual report, financial statement, or other document here..."
-        )
+        # A form defers the rerun to the submit button instead of every edit
+        with st.form("paste_form", clear_on_submit=False):
+            pasted = st.text_area(
+                "Paste your financial document text here:",
+                height=400,
+                placeholder="Paste the text from your annual report, financial statement, or other document here..."
+            )
+            submitted = st.form_submit_button("Load text")
+        
+        if submitted:
+            st.session_state.pasted_text = pasted
+        text_content = st.session_state.get("pasted_text", "")
         
         if text_content:
             st.info(f"📝 {len(text_content)} characters entered")
@@ -209,23 +507,28 @@ with tab1:
             )
         
         if extract_button:
-            # Save text to temp file
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as tmp_file:
-                tmp_file.write(text_content)
-                tmp_file_path = tmp_file.name
-            
             try:
-                # Initialize detector
-                api_key = get_api_key(api_provider)
-                detector = FinancialDetective(api_provider=api_provider, api_key=api_key)
+                # Show progress, including repair attempts for output that failed validation
+                attempt_status = st.empty()
+                
+                def show_attempt(attempt: int):
+                    attempt_status.info(f"🔁 Extracting (attempt {attempt})... asking the model to fix invalid output")
                 
-                # Show progress
                 with st.spinner(f"🤖 Extracting entities and relationships using {api_provider.upper()}..."):
-                    graph_data = detector.extract_knowledge_graph(tmp_file_path)
+                    if use_cache:
+                        graph_data = extract_graph_cached(api_provider, text_content, concurrency, show_attempt)
+                    else:
+                        graph_data = extract_graph(api_provider, text_content, concurrency, show_attempt, use_cache=False)
+                attempt_status.empty()
                 
-                # Store in session state
+                # Store in session state; artifacts are re-rendered for the new graph
                 st.session_state.graph_data = graph_data
                 st.session_state.extraction_complete = True
+                st.session_state.viz_png = None
+                st.session_state.mermaid_md = None
+                st.session_state.type_counts = None
+                st.session_state.graph_json = None
+                st.session_state.graph_detector = (api_provider, concurrency, use_cache)
                 
                 st.success("✅ Extraction complete!")
                 st.rerun()
@@ -233,10 +536,6 @@ with tab1:
             except Exception as e:
                 st.error(f"❌ Error during extraction: {str(e)}")
                 st.exception(e)
-            finally:
-                # Cleanup temp file
-                if os.path.exists(tmp_file_path):
-                    os.unlink(tmp_file_path)
     
     elif text_content and not has_key:
         st.warning("⚠️ Please configure API key in sidebar to proceed")
@@ -245,115 +544,7 @@ with tab2:
     st.header("📊 Extraction Results")
     
     if st.session_state.extraction_complete and st.session_state.graph_data:
-        graph_data = st.session_state.graph_data
-        
-        # Summary metrics
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric("Total Entities", len(graph_data['entities']))
-        
-        with col2:
-            companies = sum(1 for e in graph_data['entities'] if e['type'] == 'Company')
-            st.metric("Companies", companies)
-        
-        with col3:
-            amounts = sum(1 for e in graph_data['entities'] if e['type'] == 'Amount')
-            st.metric("Amounts", amounts)
-        
-        with col4:
-            st.metric("Relationships", len(graph_data['relationships']))
-        
-        st.divider()
-        
-        # Entities section
-        st.subheader("🏢 Entities")
-        
-        # Filter by type
-        entity_types = st.multiselect(
-            "Filter by type:",
-            ["Company", "RiskFactor", "Amount"],
-            default=["Company", "RiskFactor", "Amount"]
-        )
-        
-        filtered_entities = [e for e in graph_data['entities'] if e['type'] in entity_types]
-        
-        for entity in filtered_entities:
-            type_emoji = {
-                "Company": "🏢",
-                "RiskFactor": "⚠️",
-                "Amount": "💰"
-            }.get(entity['type'], "📌")
-            
-            with st.expander(f"{type_emoji} {entity['name']} ({entity['type']})"):
-                st.json(entity)
-        
-        st.divider()
-        
-        # Relationships section
-        st.subheader("🔗 Relationships")
-        
-        for rel in graph_data['relationships']:
-            # Find source and target names
-            source_name = next((e['name'] for e in graph_data['entities'] if e['id'] == rel['source']), rel['source'])
-            target_name = next((e['name'] for e in graph_data['entities'] if e['id'] == rel['target']), rel['target'])
-            
-            st.markdown(f"**{source_name}** --[{rel['type']}]--> **{target_name}**")
-            with st.expander("Details"):
-                st.json(rel)
-        
-        st.divider()
-        
-        # Visualizations
-        if generate_viz or generate_mermaid:
-            st.subheader("📈 Visualizations")
-            
-            if generate_viz:
-                try:
-                    # Generate visualization
-                    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_viz:
-                        tmp_viz_path = tmp_viz.name
-                    
-                    detector = FinancialDetective(api_provider=api_provider, api_key=get_api_key(api_provider))
-                    detector.visualize_graph(graph_data, tmp_viz_path)
-                    
-                    # Display image
-                    st.image(tmp_viz_path, caption="Knowledge Graph Visualization (NetworkX)")
-                    
-                    # Cleanup
-                    if os.path.exists(tmp_viz_path):
-                        os.unlink(tmp_viz_path)
-                except Exception as e:
-                    st.error(f"Error generating visualization: {e}")
-            
-            if generate_mermaid:
-                try:
-                    # Generate Mermaid chart
-                    with tempfile.NamedTemporaryFile(mode='w', suffix='.md', delete=False, encoding='utf-8') as tmp_mermaid:
-                        tmp_mermaid_path = tmp_mermaid.name
-                    
-                    detector = FinancialDetective(api_provider=api_provider, api_key=get_api_key(api_provider))
-                    detector.generate_mermaid_chart(graph_data, tmp_mermaid_path)
-                    
-                    # Read and display
-                    with open(tmp_mermaid_path, 'r', encoding='utf-8') as f:
-                        mermaid_content = f.read()
-                    
-                    st.markdown("### Mermaid Chart")
-                    st.code(mermaid_content, language='markdown')
-                    st.info("💡 Copy the Mermaid code above and paste it into https://mermaid.live to view the interactive chart")
-                    
-                    # Cleanup
-                    if os.path.exists(tmp_mermaid_path):
-                        os.unlink(tmp_mermaid_path)
-                except Exception as e:
-                    st.error(f"Error generating Mermaid chart: {e}")
-        
-        # Full JSON view
-        st.divider()
-        st.subheader("📋 Full JSON Output")
-        with st.expander("View complete JSON"):
-            st.json(graph_data)
+        _results_fragment(st.session_state.graph_data, generate_viz, generate_mermaid)
     
     else:
         st.info("👆 Go to the 'Input' tab to upload a document and extract a knowledge graph")
@@ -362,69 +553,7 @@ with tab3:
     st.header("📥 Download Outputs")
     
     if st.session_state.extraction_complete and st.session_state.graph_data:
-        graph_data = st.session_state.graph_data
-        
-        # JSON download
-        json_str = json.dumps(graph_data, indent=2, ensure_ascii=False)
-        st.download_button(
-            label="⬇️ Download JSON (graph_output.json)",
-            data=json_str,
-            file_name="graph_output.json",
-            mime="application/json",
-            use_container_width=True
-        )
-        
-        # Generate and download visualization if requested
-        if generate_viz:
-            try:
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_viz:
-                    tmp_viz_path = tmp_viz.name
-                
-                detector = FinancialDetective(api_provider=api_provider, api_key=get_api_key(api_provider))
-                detector.visualize_graph(graph_data, tmp_viz_path)
-                
-                with open(tmp_viz_path, 'rb') as f:
-                    viz_bytes = f.read()
-                
-                st.download_button(
-                    label="⬇️ Download Visualization (graph_visualization.png)",
-                    data=viz_bytes,
-                    file_name="graph_visualization.png",
-                    mime="image/png",
-                    use_container_width=True
-                )
-                
-                if os.path.exists(tmp_viz_path):
-                    os.unlink(tmp_viz_path)
-            except Exception as e:
-                st.error(f"Error generating visualization: {e}")
-        
-        # Generate and download Mermaid if requested
-        if generate_mermaid:
-            try:
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.md', delete=False, encoding='utf-8') as tmp_mermaid:
-                    tmp_mermaid_path = tmp_mermaid.name
-                
-                detector = FinancialDetective(api_provider=api_provider, api_key=get_api_key(api_provider))
-                detector.generate_mermaid_chart(graph_data, tmp_mermaid_path)
-                
-                with open(tmp_mermaid_path, 'r', encoding='utf-8') as f:
-                    mermaid_content = f.read()
-                
-                st.download_button(
-                    label="⬇️ Download Mermaid Chart (graph_mermaid.md)",
-                    data=mermaid_content,
-                    file_name="graph_mermaid.md",
-                    mime="text/markdown",
-                    use_container_width=True
-                )
-                
-                if os.path.exists(tmp_mermaid_path):
-                    os.unlink(tmp_mermaid_path)
-            except Exception as e:
-                st.error(f"Error generating Mermaid chart: {e}")
-        
-        st.success("✅ All outputs ready for download!")
+        _downloads_fragment(st.session_state.graph_data, generate_viz, generate_mermaid)
     
     else:
         st.info("👆 Extract a knowledge graph first to download outputs")
@@ -75,9 +75,10 @@ def main():
         
         # Show sample relationships
         print(f"\n🔗 Sample Relationships:")
+        id_to_name = {e['id']: e['name'] for e in graph_data['entities']}
         for i, rel in enumerate(graph_data['relationships'][:5], 1):
-            source_name = next((e['name'] for e in graph_data['entities'] if e['id'] == rel['source']), rel['source'])
-            target_name = next((e['name'] for e in graph_data['entities'] if e['id'] == rel['target']), rel['target'])
+            source_name = id_to_name.get(rel['source'], rel['source'])
+            target_name = id_to_name.get(rel['target'], rel['target'])
             print(f"   {i}. {source_name} --[{rel['type']}]--> {target_name}")
         
         if len(graph_data['relationships']) > 5: